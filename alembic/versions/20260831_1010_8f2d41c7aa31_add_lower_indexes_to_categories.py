@@ -0,0 +1,36 @@
+"""add lower() indexes to categories
+
+Revision ID: 8f2d41c7aa31
+Revises: c53b5169187d
+Create Date: 2026-08-31 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2d41c7aa31'
+down_revision = 'c53b5169187d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Functional indexes so the case-insensitive identifier lookup in
+    # CategoryManager resolves via index scans instead of seq scans.
+    op.create_index(
+        'ix_categories_lower_short_name',
+        'categories',
+        [sa.text('lower(short_name)')],
+    )
+    op.create_index(
+        'ix_categories_lower_name',
+        'categories',
+        [sa.text('lower(name)')],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_categories_lower_name', table_name='categories')
+    op.drop_index('ix_categories_lower_short_name', table_name='categories')
@@ -0,0 +1,35 @@
+"""add expense_count to categories
+
+Revision ID: b71c0de55e92
+Revises: 8f2d41c7aa31
+Create Date: 2026-08-31 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71c0de55e92'
+down_revision = '8f2d41c7aa31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'categories',
+        sa.Column('expense_count', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # Backfill from existing expenses so the counter starts in sync.
+    op.execute(
+        """
+        UPDATE categories SET expense_count = (
+            SELECT COUNT(*) FROM expenses WHERE expenses.category_id = categories.id
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('categories', 'expense_count')
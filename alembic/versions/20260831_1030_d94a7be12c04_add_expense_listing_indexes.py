@@ -0,0 +1,34 @@
+"""add expense listing indexes
+
+Revision ID: d94a7be12c04
+Revises: b71c0de55e92
+Create Date: 2026-08-31 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd94a7be12c04'
+down_revision = 'b71c0de55e92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_expenses_user_id_expense_date', 'expenses', ['user_id', 'expense_date']
+    )
+    op.create_index(
+        'ix_expenses_user_id_created_at', 'expenses', ['user_id', 'created_at']
+    )
+    op.create_index(
+        'ix_expense_tag_tag_id_expense_id', 'expense_tag', ['tag_id', 'expense_id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_expense_tag_tag_id_expense_id', table_name='expense_tag')
+    op.drop_index('ix_expenses_user_id_created_at', table_name='expenses')
+    op.drop_index('ix_expenses_user_id_expense_date', table_name='expenses')
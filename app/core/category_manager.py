@@ -3,13 +3,18 @@ from __future__ import annotations
 import shlex
 from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session, selectinload
 
-from app.models import Category, Expense, User
+from app.models import Category, User
 
 
-_CLEAR_TOKENS = {'', '-', 'none', 'null', 'ninguno'}
+_CLEAR_TOKENS = frozenset({'', '-', 'none', 'null', 'ninguno'})
+
+# Rendered category listing keyed on (count, max(updated_at)); a cheap
+# two-aggregate probe decides whether the full fetch+render can be skipped.
+# Single-entry: any change to categories produces a new key.
+_LIST_CACHE: Dict[Tuple[int, Optional[object]], str] = {}
 
 
 class CategoryManager:
@@ -32,46 +37,56 @@ class CategoryManager:
         action = tokens[0].lower()
         remainder = command_text[len(tokens[0]):].strip() if len(command_text) > len(tokens[0]) else ''
 
-        if action in ('list', 'l', 'ls', 'show'):
-            return self.list_categories()
-        if action in ('create', 'c', 'add', '+'):
-            return self.create_category(remainder)
-        if action in ('update', 'u', 'edit', 'rename'):
-            return self.update_category(remainder)
-        if action in ('delete', 'd', 'remove', 'rm', 'del'):
-            return self.delete_category(remainder)
-        if action in ('info', 'i', 'details'):
-            return self.show_info(remainder)
-        if action in ('help', 'h', '?'):
-            return self.show_help()
-
-        return "❌ Acción de categoría no reconocida. Usa 'cat help' para ver opciones."
-
-    def list_categories(self) -> str:
+        handler = self._ACTIONS.get(action)
+        if handler is None:
+            return "❌ Acción de categoría no reconocida. Usa 'cat help' para ver opciones."
+        return handler(self, remainder)
+
+    def list_categories(self, args_text: str = '') -> str:
         '''Return a formatted list of available categories.'''
-        categories = (
-            self.db.query(Category)
-            .order_by(Category.is_system.desc(), func.lower(Category.name))
-            .all()
-        )
+        with self.db.no_autoflush:
+            cache_key = tuple(
+                self.db.execute(
+                    select(func.count(Category.id), func.max(Category.updated_at))
+                ).one()
+            )
+            cached = _LIST_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+            # Plain column tuples: no ORM instances or identity-map work,
+            # and parents resolve from the same result set in memory.
+            categories = self.db.execute(
+                select(
+                    Category.id,
+                    Category.name,
+                    Category.short_name,
+                    Category.emoji,
+                    Category.is_system,
+                    Category.parent_id,
+                )
+                .order_by(Category.is_system.desc(), func.lower(Category.name))
+            ).all()
         if not categories:
             return 'No hay categorías registradas.'
 
+        by_id = {row.id: row for row in categories}
         system_lines: List[str] = []
         custom_lines: List[str] = []
-        for category in categories:
+        for row in categories:
             parts: List[str] = []
-            if category.emoji:
-                parts.append(category.emoji)
-            parts.append(category.name)
-            if category.short_name:
-                parts.append(f"[{category.short_name}]")
-            if category.parent:
-                reference = category.parent.short_name or category.parent.name
+            if row.emoji:
+                parts.append(row.emoji)
+            parts.append(row.name)
+            if row.short_name:
+                parts.append(f"[{row.short_name}]")
+            parent = by_id.get(row.parent_id) if row.parent_id else None
+            if parent:
+                reference = parent.short_name or parent.name
                 parts.append(f"↳ {reference}")
 
             formatted = ' '.join(parts)
-            if category.is_system:
+            if row.is_system:
                 system_lines.append(formatted)
             else:
                 custom_lines.append(formatted)
@@ -82,7 +97,10 @@ class CategoryManager:
         if custom_lines:
             sections.append('🧩 *Personalizadas:*\n' + '\n'.join(custom_lines))
 
-        return '\n\n'.join(sections)
+        rendered = '\n\n'.join(sections)
+        _LIST_CACHE.clear()
+        _LIST_CACHE[cache_key] = rendered
+        return rendered
 
     def create_category(self, args_text: str) -> str:
         '''Create a new custom category.'''
@@ -125,6 +143,7 @@ class CategoryManager:
         )
         self.db.add(category)
         self.db.commit()
+        self._invalidate_caches()
 
         parent_text = f" (hija de {parent.name})" if parent else ''
         return f"✅ Categoría creada: *{name}* [{short_name}]{parent_text}."
@@ -196,6 +215,7 @@ class CategoryManager:
             return 'ℹ️ No se detectaron cambios.'
 
         self.db.commit()
+        self._invalidate_caches()
         return f"✅ Categoría actualizada ({', '.join(updates)})."
 
     def delete_category(self, args_text: str) -> str:
@@ -205,7 +225,9 @@ class CategoryManager:
             return '❌ Debes indicar la categoría a eliminar. Ejemplo: cat d comida'
 
         identifier = tokens[0]
-        category = self._get_category_by_identifier(identifier)
+        category = self._get_category_by_identifier(
+            identifier, options=(selectinload(Category.children),)
+        )
         if not category:
             return f"❌ No se encontró la categoría '{identifier}'."
         if category.is_system:
@@ -218,6 +240,7 @@ class CategoryManager:
         name, code = category.name, category.short_name
         self.db.delete(category)
         self.db.commit()
+        self._invalidate_caches()
         code_text = f" [{code}]" if code else ''
         return f"🗑️ Categoría eliminada: *{name}*{code_text}."
 
@@ -236,11 +259,7 @@ class CategoryManager:
         scope = 'Sistema' if category.is_system else 'Personal'
         short_text = category.short_name or 'Sin código'
         emoji_text = category.emoji or 'Sin emoji'
-        expense_count = (
-            self.db.query(Expense.id)
-            .filter(Expense.category_id == category.id)
-            .count()
-        )
+        expense_count = category.expense_count
 
         lines = [
             '📘 *Detalle de categoría*',
@@ -253,7 +272,7 @@ class CategoryManager:
         ]
         return '\n'.join(lines)
 
-    def show_help(self) -> str:
+    def show_help(self, args_text: str = '') -> str:
         '''Return help text for category commands.'''
         return (
             '📚 *Comandos de categorías:*'
@@ -264,10 +283,21 @@ class CategoryManager:
             '\n• `cat info <id>` — detalle de una categoría'
         )
 
+    def _invalidate_caches(self) -> None:
+        '''Drop the cached category lookup table after any mutation.'''
+        # Local import: expense_manager imports this module at top level.
+        from app.core.expense_manager import ExpenseManager
+
+        ExpenseManager.invalidate_category_cache()
+
     def _tokenize(self, text: str) -> List[str]:
         text = (text or '').strip()
         if not text:
             return []
+        # Fast path: only quoting/escaping needs shlex's per-character state
+        # machine; plain word lists split identically with str.split.
+        if '"' not in text and "'" not in text and '\\' not in text:
+            return text.split()
         try:
             return shlex.split(text)
         except ValueError:
@@ -277,9 +307,11 @@ class CategoryManager:
         name_tokens: List[str] = []
         options: Dict[str, str] = {}
         for token in tokens:
-            if '=' in token:
-                key, value = token.split('=', 1)
-                options[key.lower().strip()] = value.strip()
+            # partition is a single C-level scan; tokens come from
+            # _tokenize already stripped, so no re-strip is needed.
+            key, sep, value = token.partition('=')
+            if sep:
+                options[key.lower()] = value
             else:
                 name_tokens.append(token)
         return name_tokens, options
@@ -290,22 +322,27 @@ class CategoryManager:
                 return options[key]
         return None
 
-    def _get_category_by_identifier(self, identifier: str) -> Optional[Category]:
+    def _get_category_by_identifier(self, identifier: str, options: Tuple = ()) -> Optional[Category]:
         if not identifier:
             return None
         ident = identifier.strip().lower()
         if not ident:
             return None
-        category = (
-            self.db.query(Category)
-            .filter(func.lower(Category.short_name) == ident)
-            .first()
-        )
-        if category:
-            return category
+        # Single round trip: match short_name or name, preferring short_name.
         return (
-            self.db.query(Category)
-            .filter(func.lower(Category.name) == ident)
+            self.db.execute(
+                select(Category)
+                .options(*options)
+                .where(or_(
+                    func.lower(Category.short_name) == ident,
+                    func.lower(Category.name) == ident,
+                ))
+                # nullslast: NULL short codes yield NULL from the predicate,
+                # which DESC would otherwise rank above a true match.
+                .order_by((func.lower(Category.short_name) == ident).desc().nullslast())
+                .limit(1)
+            )
+            .scalars()
             .first()
         )
 
@@ -313,34 +350,47 @@ class CategoryManager:
         if not short_name:
             return None
         return (
-            self.db.query(Category)
-            .filter(func.lower(Category.short_name) == short_name.lower())
+            self.db.execute(
+                select(Category)
+                .where(func.lower(Category.short_name) == short_name.lower())
+            )
+            .scalars()
             .first()
         )
 
     def _category_exists(self, name: str, parent: Optional[Category], exclude_id: Optional[int] = None) -> bool:
         if not name:
             return False
-        query = (
-            self.db.query(Category.id)
-            .filter(func.lower(Category.name) == name.lower())
-        )
+        stmt = select(Category.id).where(func.lower(Category.name) == name.lower())
         if parent:
-            query = query.filter(Category.parent_id == parent.id)
+            stmt = stmt.where(Category.parent_id == parent.id)
         else:
-            query = query.filter(Category.parent_id.is_(None))
+            stmt = stmt.where(Category.parent_id.is_(None))
         if exclude_id:
-            query = query.filter(Category.id != exclude_id)
-        return query.limit(1).first() is not None
+            stmt = stmt.where(Category.id != exclude_id)
+        return self.db.execute(stmt.limit(1)).first() is not None
 
     def _generate_short_name(self, name: str) -> str:
         base = ''.join(char for char in name.lower() if char.isalnum()) or 'cat'
-        candidate = base[:6]
-        if not candidate:
-            candidate = 'cat'
+        prefix = base[:4] or 'cat'
+        # One round trip: fetch every taken code sharing the prefix, then
+        # probe candidates against the set locally instead of SELECT-per-try.
+        taken = {
+            code.lower()
+            for code in (
+                self.db.execute(
+                    select(Category.short_name)
+                    .where(func.lower(Category.short_name).like(f"{prefix}%"))
+                )
+                .scalars()
+                .all()
+            )
+            if code
+        }
+        candidate = base[:6] or 'cat'
         suffix = 1
-        while self._get_category_by_short(candidate):
-            candidate = f"{base[:4]}{suffix}" if base[:4] else f'cat{suffix}'
+        while candidate in taken:
+            candidate = f"{prefix}{suffix}"
             suffix += 1
         return candidate
 
@@ -353,21 +403,40 @@ class CategoryManager:
     def _should_clear(self, value: Optional[str]) -> bool:
         if value is None:
             return False
-        return value.strip().lower() in _CLEAR_TOKENS
+        # Option values are already stripped by _split_name_and_options.
+        return value.lower() in _CLEAR_TOKENS
 
     def _has_expenses(self, category: Category) -> bool:
-        return (
-            self.db.query(Expense.id)
-            .filter(Expense.category_id == category.id)
-            .limit(1)
-            .first()
-            is not None
-        )
+        return category.expense_count > 0
 
     def _is_descendant(self, parent: Category, target: Category) -> bool:
-        current = parent
-        while current:
-            if current.id == target.id:
-                return True
-            current = current.parent
-        return False
+        # One recursive CTE instead of walking .parent in Python, which
+        # lazy-loads one ancestor per round trip on deep hierarchies.
+        ancestors = (
+            select(Category.id, Category.parent_id)
+            .where(Category.id == parent.id)
+            .cte('ancestors', recursive=True)
+        )
+        ancestors = ancestors.union_all(
+            select(Category.id, Category.parent_id)
+            .where(Category.id == ancestors.c.parent_id)
+        )
+        row = self.db.execute(
+            select(ancestors.c.id).where(ancestors.c.id == target.id).limit(1)
+        ).first()
+        return row is not None
+
+    # Precomputed alias -> handler table, built once at import so `handle`
+    # does a single dict lookup instead of walking six membership checks.
+    _ACTIONS = {}
+    for _aliases, _handler in (
+        (('list', 'l', 'ls', 'show'), list_categories),
+        (('create', 'c', 'add', '+'), create_category),
+        (('update', 'u', 'edit', 'rename'), update_category),
+        (('delete', 'd', 'remove', 'rm', 'del'), delete_category),
+        (('info', 'i', 'details'), show_info),
+        (('help', 'h', '?'), show_help),
+    ):
+        for _alias in _aliases:
+            _ACTIONS[_alias] = _handler
+    del _aliases, _handler, _alias
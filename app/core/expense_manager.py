@@ -1,11 +1,14 @@
 import re
 import datetime
+import threading
+import time
 from datetime import timedelta
 from typing import List, Optional, Tuple
-from sqlalchemy.orm import Session,Query
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session,Query, joinedload, load_only, selectinload
 
 
-from app.models import Category, Expense, Tag, User
+from app.models import Category, Expense, ExpenseTag, Tag, User
 from app.core.tag_manager import TagManager
 from app.core.category_manager import CategoryManager
 from app.services.db_service import DB
@@ -13,53 +16,159 @@ from app.services.whatsapp_service import WhatsAppService
 from app.webhooks.models import Interactive
 
 
+# Compiled once at import so the hot message-parsing path skips the
+# per-call pattern lookup in re's internal cache.
+_TAG_SUB_RE = re.compile(r"\s*@([^\s]+)")
+# One pass handles dd/mm, dd-mm and the optional 2- or 4-digit year.
+_DATE_RE = re.compile(r"\b(?P<d>\d{1,2})[/-](?P<m>\d{1,2})(?:[/-](?P<y>\d{2,4}))?\b")
+
+# Spanish month tables, built once instead of per call.
+_MESES_NAME_TO_NUM = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4,
+    "mayo": 5, "junio": 6, "julio": 7, "agosto": 8,
+    "septiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+_MESES_NUM_TO_NAME = {num: name for name, num in _MESES_NAME_TO_NUM.items()}
+# Names plus "1".."12" and zero-padded forms in one table, so month
+# parsing is a single lookup with no int() and no exception machinery.
+_MES_LOOKUP = {
+    **_MESES_NAME_TO_NUM,
+    **{str(num): num for num in range(1, 13)},
+    **{f"{num:02d}": num for num in range(1, 10)},
+}
+
+# How long the in-process category lookup table stays valid.
+_CATEGORY_CACHE_TTL = 300
+
+# Summary period aliases: hashed membership instead of list scans.
+_DAILY = frozenset({"day", "hoy", "today", "diario"})
+_WEEKLY = frozenset({"week", "semana", "semanal"})
+_MONTHLY = frozenset({"month", "mes", "mensual"})
+
+# en-US -> es-CL separator swap done in one translate pass.
+_USD_TRANS = str.maketrans({",": ".", ".": ","})
+_CLP_TRANS = str.maketrans({",": "."})
+
+
 class ExpenseManager:
     """Handles expense-related operations and business logic."""
 
-    def __init__(self, db: Session, user: User):
+    # (timestamp, {lowercased name/short_name -> category id}), shared by
+    # all instances so warm Lambdas resolve categories without a query.
+    # Listing page size: keeps WhatsApp replies and row fetches bounded no
+    # matter how much history a user has.
+    _PAGE_SIZE = 30
+
+    _category_cache: Optional[Tuple[float, dict]] = None
+    _category_cache_lock = threading.Lock()
+
+    @classmethod
+    def invalidate_category_cache(cls) -> None:
+        """Drop the cached category table after categories change."""
+        with cls._category_cache_lock:
+            cls._category_cache = None
+
+    def __init__(self, db: Session, user: User, background=None):
         self.db = db
         self.user = user
+        self.background = background
         self.expenses: Query[Expense] = DB(db).get_expenses(user.id)
         self.tag_manager = TagManager(db, user)
+
+    def _queue(self, send_fn, *args) -> None:
+        """Run a WhatsAppService send after the webhook response when possible.
+
+        With FastAPI BackgroundTasks the Meta HTTP call happens after the
+        request is answered (Mangum still awaits it before the Lambda
+        freezes); without one we fall back to sending inline.
+        """
+        if self.background is not None:
+            self.background.add_task(send_fn, *args)
+        else:
+            send_fn(*args)
     
     def list_categories(self) -> str:
         """Delegate to CategoryManager to keep backward compatibility."""
         manager = CategoryManager(self.db, self.user)
         return manager.list_categories()
 
+    def _display_query(self) -> Query:
+        """Base query for expenses that will be rendered via custom_str.
+
+        Eager-loads category (joined) and tags (select-in) so rendering a
+        page of expenses never lazy-loads per row, and narrows the column
+        list to what custom_str actually prints (raw_text and the
+        provenance columns stay in the database).
+        """
+        return self.expenses.options(
+            load_only(
+                Expense.amount,
+                Expense.currency,
+                Expense.description,
+                Expense.expense_date,
+                Expense.category_id,
+            ),
+            joinedload(Expense.category),
+            selectinload(Expense.tags),
+        )
+
     def handle_interactive_response(self, interactive: Interactive) -> None:
         """Handle interactive button responses for expense confirmation/rejection."""
         if interactive.type == "button_reply" and interactive.button_reply:
             button_id: str = interactive.button_reply.id
             instruction, id_str = button_id.split("_", 1)
             expense_id = int(id_str)
-            expense: Expense = (
-                self.db.query(Expense)
-                .filter_by(id=expense_id, user_id=self.user.id)
-                .first()
-            )
 
-            if not expense:
-                WhatsAppService.send_message(
-                    self.user.phone, "❌ No se encontró el gasto solicitado."
+            # Unknown actions answer without touching the database.
+            if instruction not in ("confirm", "decline"):
+                self._queue(
+                    WhatsAppService.send_message,
+                    self.user.phone,
+                    f"⚠️ Acción no reconocida: {instruction}",
                 )
                 return
 
             if instruction == "confirm":
-                expense.status = "confirmed"
-                self.db.commit()
+                # Single UPDATE ... RETURNING: lookup and status change in
+                # one round-trip instead of SELECT + UPDATE.
+                expense = self.db.execute(
+                    update(Expense)
+                    .where(Expense.id == expense_id, Expense.user_id == self.user.id)
+                    .values(status="confirmed")
+                    .returning(Expense)
+                ).scalars().first()
+                if expense is None:
+                    self._queue(
+                        WhatsAppService.send_message,
+                        self.user.phone,
+                        "❌ No se encontró el gasto solicitado.",
+                    )
+                    return
                 message = f"✅ *¡Gasto confirmado exitosamente!*\n{expense}\n\n¡Tu gasto ha sido registrado correctamente! 💫"
-
-            elif instruction == "decline":
-                # delete expense
+                self.db.commit()
+            else:
+                # Decline stays an ORM delete so the category counter event
+                # fires; the message is rendered before the row disappears.
+                expense: Expense = (
+                    self.db.query(Expense)
+                    .filter_by(id=expense_id, user_id=self.user.id)
+                    .first()
+                )
+                if not expense:
+                    self._queue(
+                        WhatsAppService.send_message,
+                        self.user.phone,
+                        "❌ No se encontró el gasto solicitado.",
+                    )
+                    return
                 message = f"❌ *Gasto rechazado:*\n{expense}\n\nEl gasto ha sido rechazado y no se guardará en tus registros."
                 self.db.delete(expense)
                 self.db.commit()
-            else:
-                message = f"⚠️ Acción no reconocida: {instruction}"
 
-            WhatsAppService.send_message(self.user.phone, message)
-    
+            # Status change is committed above, so the reply can safely
+            # go out after the response.
+            self._queue(WhatsAppService.send_message, self.user.phone, message)
+
     def create_expense_from_text(self, text: str) -> None:
         """Process expense creation from text message."""
         parsed_text = text.strip().lower()
@@ -74,28 +183,25 @@ class ExpenseManager:
 
         # Parse expense details
         items = cuerpo.split()
-        price = items[0]
-        currency = "CLP"
-        
-        if ("," in price) or ("." in price):
-            price = price.replace(",", ".")
-            price = float(price + "0")
-            currency = "USD"
+        tok = items[0]
+        if tok.isdigit():
+            price, currency = int(tok), "CLP"
         else:
-            price = int(price)
-            
+            # Decimal separator means USD; normalize comma to dot and round
+            # to cents in one numeric step.
+            price, currency = round(float(tok.replace(",", ".")), 2), "USD"
+
+
         category = items[1] if len(items) > 1 else "x"
         description = " ".join(items[2:]) if len(items) > 2 else "No description"
 
-        category_obj = self.db.query(Category).filter(
-            (Category.short_name.ilike(category)) | (Category.name.ilike(category))
-        ).first()
+        category_id = self._resolve_category_id(category)
 
         # Create expense
         expense = Expense(
             user_id=self.user.id,
             amount=price,
-            category=category_obj,
+            category_id=category_id,
             description=description,
             currency=currency,
             raw_text=text,
@@ -103,27 +209,61 @@ class ExpenseManager:
             expense_date=date_str,
         )
         self.db.add(expense)
-        
-        # Add tags
-        if tags:
-            for tag in tag_objs:
-                expense.tags.append(tag)
+
+        # Add tags in one assignment instead of per-item appends
+        if tag_objs:
+            expense.tags = list(tag_objs)
         self.db.commit()
         
-        # Send confirmation message with buttons
+        # Send confirmation message with buttons (expense.id is assigned by
+        # the commit above, before the send is queued)
         confirmation_text = f"💰 *Gasto en proceso:* \n{expense}"
-        WhatsAppService.send_confirm_interaction(self.user.phone, confirmation_text, expense.id)
+        self._queue(WhatsAppService.send_confirm_interaction, self.user.phone, confirmation_text, expense.id)
     
+    def _resolve_category_id(self, key: str) -> Optional[int]:
+        """Resolve a category name or short code against a cached table.
+
+        Categories are tiny and near-static, so one SELECT every
+        _CATEGORY_CACHE_TTL seconds replaces an ILIKE query per message.
+        """
+        now = time.monotonic()
+        cache = ExpenseManager._category_cache
+        if cache is None or now - cache[0] > _CATEGORY_CACHE_TTL:
+            with ExpenseManager._category_cache_lock:
+                cache = ExpenseManager._category_cache
+                if cache is None or now - cache[0] > _CATEGORY_CACHE_TTL:
+                    mapping = {}
+                    for cat_id, name, short_name in self.db.query(
+                        Category.id, Category.name, Category.short_name
+                    ):
+                        mapping[name.lower()] = cat_id
+                        if short_name:
+                            mapping[short_name.lower()] = cat_id
+                    cache = (now, mapping)
+                    ExpenseManager._category_cache = cache
+        return cache[1].get(key.lower())
+
     def _split_text_and_tag(self, texto: str) -> Tuple[str, Optional[List[str]]]:
         """
         Separa el texto de una o más etiquetas con @ al final.
         Retorna (texto_sin_tags, tags) como tupla.
         Si no hay etiquetas, tags será None.
         """
-        # Busca todas las etiquetas @tag al final del texto
-        tags = re.findall(r"@([^\s]+)", texto)
-        # Elimina las etiquetas del texto
-        cuerpo = re.sub(r"\s*@([^\s]+)", "", texto).strip()
+        # Fast path: most messages carry no tags, and a single-char scan is
+        # far cheaper than a regex pass.
+        if "@" not in texto:
+            return texto, None
+        # Un solo recorrido: captura las etiquetas y arma el cuerpo con los
+        # tramos entre matches, en vez de findall + sub (dos pasadas regex).
+        tags: List[str] = []
+        pieces: List[str] = []
+        prev = 0
+        for match in _TAG_SUB_RE.finditer(texto):
+            tags.append(match.group(1))
+            pieces.append(texto[prev:match.start()])
+            prev = match.end()
+        pieces.append(texto[prev:])
+        cuerpo = "".join(pieces).strip()
         return cuerpo, tags if tags else None
     
     def _extract_date(self, text: str) -> Tuple[str, Optional[str]]:
@@ -133,38 +273,32 @@ class ExpenseManager:
         If only day and month, assumes current year.
         Returns a tuple (text_without_date, date_in_YYYY-MM-DD format or None).
         """
-        date_patterns = [
-            r"(\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b)",  # dd/mm/yyyy or dd-mm-yyyy or dd/mm/yy or dd-mm-yy
-            r"(\b\d{1,2}[/-]\d{1,2}\b)",              # dd/mm or dd-mm
-        ]
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                date_str = match.group(1)
-                try:
-                    if re.match(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", date_str):
-                        # Handle full date with year
-                        parts = re.split(r"[/-]", date_str)
-                        day = int(parts[0])
-                        month = int(parts[1])
-                        year = int(parts[2])
-                        if year < 100:  # Handle two-digit year
-                            year += 2000
-                    elif re.match(r"\d{1,2}[/-]\d{1,2}", date_str):
-                        # Handle date without year, assume current year
-                        parts = re.split(r"[/-]", date_str)
-                        day = int(parts[0])
-                        month = int(parts[1])
-                        year = datetime.datetime.now().year
-                    else:
-                        continue
-                    
-                    extracted_date = datetime.datetime(year, month, day, 12, 0)
-                    text_without_date = text.replace(date_str, "").strip()
-                    return text_without_date, extracted_date.isoformat()
-                except ValueError:
-                    continue
-        return text, datetime.datetime.now().isoformat()
+        now = datetime.datetime.now()
+        # Dates always contain a separator; skip the regex when absent.
+        if "/" not in text and "-" not in text:
+            return text, now.isoformat()
+        match = _DATE_RE.search(text)
+        if match:
+            try:
+                day = int(match.group("d"))
+                month = int(match.group("m"))
+                year_str = match.group("y")
+                if year_str:
+                    year = int(year_str)
+                    if year < 100:  # Handle two-digit year
+                        year += 2000
+                else:
+                    # No year given, assume current year
+                    year = now.year
+
+                extracted_date = datetime.datetime(year, month, day, 12, 0)
+                # Slice out just the matched span; replace() would rescan the
+                # string and drop identical substrings elsewhere.
+                text_without_date = (text[:match.start()] + text[match.end():]).strip()
+                return text_without_date, extracted_date.isoformat()
+            except ValueError:
+                pass
+        return text, now.isoformat()
 
     def list_expenses(self, text: str) -> str:
         """List expenses for the user based on the provided text."""
@@ -172,111 +306,137 @@ class ExpenseManager:
         text, tags = self._split_text_and_tag(text)
 
         if tags:
-            return self._list_expenses_by_tags(tags)
+            return self._list_expenses_by_tags(tags, text)
         else:
             return self._list_expenses_by_month(text)
 
-    def _list_expenses_by_tags(self, tags: List[str]) -> str:
-        """List expenses filtered by tags."""
-        expenses_query = self.expenses.join(Expense.tags).filter(Tag.name.in_(tags))
-        expenses = expenses_query.order_by(Expense.expense_date.desc()).all()
-        
-        if not expenses:
+    def _list_expenses_by_tags(self, tags: List[str], page_text: str = "") -> str:
+        """List expenses carrying *all* the requested tags."""
+        # Grouped association-table scan: one pass over expense_tag, AND
+        # semantics via HAVING, and no duplicate rows to dedup in Python.
+        # Repeated tags in the message count once, matching the DISTINCT.
+        unique_tags = set(tags)
+        matching_ids = (
+            select(ExpenseTag.expense_id)
+            .join(Tag, Tag.id == ExpenseTag.tag_id)
+            .where(Tag.name.in_(unique_tags))
+            .group_by(ExpenseTag.expense_id)
+            .having(func.count(func.distinct(Tag.name)) == len(unique_tags))
+        )
+        page, _ = self._parse_page(page_text.split())
+        row_filter = Expense.id.in_(matching_ids)
+        rows, has_more = self._fetch_page(
+            self._display_query()
+            .filter(row_filter)
+            .order_by(Expense.expense_date.desc()),
+            page,
+        )
+        if not rows:
             return "No se encontraron gastos con las etiquetas especificadas."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        header = f"📋 *Gastos con etiquetas {', '.join(tags)}:* {total_clp} CLP / {total_usd} USD\n\n"
-        
-        expenses_list = ""
-        for expense in expenses:
-            expenses_list += expense.custom_str(include_category=False, include_tags=True) + "\n\n"
-        
-        return header + expenses_list
+
+        total_clp, total_usd = self._currency_totals(row_filter)
+        body = [f"📋 *Gastos con etiquetas {', '.join(tags)}:* {total_clp} CLP / {total_usd} USD\n\n"]
+        for expense in rows:
+            body.append(expense.custom_str(include_category=False, include_tags=True))
+            body.append("\n\n")
+        if has_more:
+            body.append(f"💡 Usa `pagina {page + 1}` para ver más gastos.")
+        return "".join(body)
 
     def _list_expenses_by_month(self, text: str) -> str:
-        """List expenses filtered by month and display options."""
+        """List expenses filtered by month, page and display options."""
         items = text.split()
+        page, items = self._parse_page(items)
         month_input = items[1] if len(items) > 1 else None
         display_options = self._parse_display_options(items)
-        
+
         month = self._parse_month(month_input) if month_input else None
         if month_input and month is None:
             return "❌ Mes no válido. Usa número (1-12) o nombre del mes en español."
-        
-        expenses = self._get_expenses_by_month(month)
-        if not expenses:
+
+        include_cat = display_options["cat"]
+        include_tags = display_options["tags"]
+
+        filters = self._month_filters(month)
+        rows, has_more = self._fetch_page(
+            self._display_query()
+            .filter(*filters)
+            .order_by(Expense.expense_date.desc()),
+            page,
+        )
+        if not rows:
             return "No se encontraron gastos para el período especificado."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        header = self._build_month_header(month, total_clp, total_usd)
-        
-        expenses_list = ""
-        for expense in expenses:
-            expenses_list += expense.custom_str(display_options["cat"], display_options["tags"]) + "\n\n"
-        
-        return header + expenses_list
+
+        total_clp, total_usd = self._currency_totals(*filters)
+        body = [self._build_month_header(month, total_clp, total_usd)]
+        for expense in rows:
+            body.append(expense.custom_str(include_cat, include_tags))
+            body.append("\n\n")
+        if has_more:
+            body.append(f"💡 Usa `pagina {page + 1}` para ver más gastos.")
+        return "".join(body)
+
+    def _parse_page(self, items: List[str]) -> Tuple[int, List[str]]:
+        """Pull an optional `pagina N` pair out of command items."""
+        for i, item in enumerate(items):
+            if item in ("pagina", "página", "pag") and i + 1 < len(items) and items[i + 1].isdigit():
+                return max(int(items[i + 1]), 1), items[:i] + items[i + 2:]
+        return 1, items
+
+    def _fetch_page(self, query: Query, page: int) -> Tuple[List[Expense], bool]:
+        """Fetch one listing page plus a lookahead row to flag more results."""
+        rows = (
+            query.offset((page - 1) * self._PAGE_SIZE)
+            .limit(self._PAGE_SIZE + 1)
+            .all()
+        )
+        return rows[: self._PAGE_SIZE], len(rows) > self._PAGE_SIZE
+
+    def _currency_totals(self, *filters) -> Tuple[str, str]:
+        """Formatted CLP/USD sums for a filter set, aggregated in SQL."""
+        totals = {"CLP": 0, "USD": 0}
+        for currency, amount in (
+            self.expenses.filter(*filters)
+            .with_entities(Expense.currency, func.sum(Expense.amount))
+            .group_by(Expense.currency)
+        ):
+            totals[currency] = totals.get(currency, 0) + amount
+        return (
+            self.parse_money_text(totals["CLP"], "CLP"),
+            self.parse_money_text(totals["USD"], "USD"),
+        )
 
     def _parse_display_options(self, items: List[str]) -> dict:
         """Parse display options from command items."""
+        items_set = frozenset(items)
         return {
-            "cat": "cat" in items,
-            "tags": "tags" in items
+            "cat": "cat" in items_set,
+            "tags": "tags" in items_set,
         }
 
     def _parse_month(self, month_input: str) -> Optional[int]:
         """Parse month from string input (number or Spanish name)."""
-        meses = {
-            "enero": 1, "febrero": 2, "marzo": 3, "abril": 4,
-            "mayo": 5, "junio": 6, "julio": 7, "agosto": 8,
-            "septiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12
-        }
-        
-        try:
-            month = int(month_input)
-            if 1 <= month <= 12:
-                return month
-            return None
-        except ValueError:
-            return meses.get(month_input.lower())
-
-    def _get_expenses_by_month(self, month: Optional[int]) -> List[Expense]:
-        """Get expenses filtered by month."""
-        expenses_query = self.expenses
-        
-        if month:
-            current_year = datetime.datetime.now().year
-            start_date = datetime.datetime(current_year, month, 1)
-            if month == 12:
-                end_date = datetime.datetime(current_year + 1, 1, 1)
-            else:
-                end_date = datetime.datetime(current_year, month + 1, 1)
-            
-            expenses_query = expenses_query.filter(
-                Expense.expense_date >= start_date,
-                Expense.expense_date < end_date
-            )
-        
-        return expenses_query.order_by(Expense.expense_date.desc()).all()
-
-    def _calculate_totals(self, expenses: List[Expense]) -> Tuple[str, str]:
-        """Calculate and format total amounts for CLP and USD."""
-        total_clp = sum(exp.amount for exp in expenses if exp.currency == "CLP")
-        total_usd = sum(exp.amount for exp in expenses if exp.currency == "USD")
-        
-        formatted_clp = self.parse_money_text(total_clp, "CLP")
-        formatted_usd = self.parse_money_text(total_usd, "USD")
-        
-        return formatted_clp, formatted_usd
+        return _MES_LOOKUP.get(month_input.lower())
+
+    def _month_filters(self, month: Optional[int]) -> Tuple:
+        """Filter criteria for a month of the current year (empty if None)."""
+        if not month:
+            return ()
+        current_year = datetime.datetime.now().year
+        start_date = datetime.datetime(current_year, month, 1)
+        if month == 12:
+            end_date = datetime.datetime(current_year + 1, 1, 1)
+        else:
+            end_date = datetime.datetime(current_year, month + 1, 1)
+        return (
+            Expense.expense_date >= start_date,
+            Expense.expense_date < end_date,
+        )
 
     def _build_month_header(self, month: Optional[int], total_clp: str, total_usd: str) -> str:
         """Build header for month-based expense listing."""
         if month:
-            meses = {
-                1: "enero", 2: "febrero", 3: "marzo", 4: "abril",
-                5: "mayo", 6: "junio", 7: "julio", 8: "agosto",
-                9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre"
-            }
-            month_name = meses[month]
+            month_name = _MESES_NUM_TO_NAME[month]
             return f"📋 *Gastos {month_name}:* {total_clp} CLP / {total_usd} USD\n\n"
         else:
             return f"📋 *Gastos:* {total_clp} CLP / {total_usd} USD\n\n"
@@ -287,11 +447,11 @@ class ExpenseManager:
         items = text.strip().lower().split()
         period = items[1] if items else "day"
         
-        if period in ["day", "hoy", "today", "diario"]:
+        if period in _DAILY:
             return self._get_daily_summary(now)
-        elif period in ["week", "semana", "semanal"]:
+        elif period in _WEEKLY:
             return self._get_weekly_summary(now)
-        elif period in ["month", "mes", "mensual"]:
+        elif period in _MONTHLY:
             # Check if a specific month is provided
             month_input = items[2] if len(items) > 2 else None
             target_month = self._parse_month(month_input) if month_input else now.month
@@ -304,41 +464,90 @@ class ExpenseManager:
         else:
             return "❌ Período no válido. Usa: 'hoy', 'semana' o 'mes [mes_opcional]'"
 
+    def _aggregate_range(self, start_date: datetime.datetime, end_date: datetime.datetime):
+        """Aggregate totals, count and category breakdown in SQL for a date range.
+
+        Returns (totals, count, categories) where totals maps currency to sum
+        and categories maps name to {"clp", "usd", "count"}, so summary
+        builders never have to stream full expense rows.
+        """
+        base = self.expenses.filter(
+            Expense.expense_date >= start_date,
+            Expense.expense_date < end_date,
+        )
+        totals = {"CLP": 0, "USD": 0}
+        count = 0
+        for currency, amount, n in (
+            base.with_entities(Expense.currency, func.sum(Expense.amount), func.count())
+            .group_by(Expense.currency)
+        ):
+            totals[currency] = totals.get(currency, 0) + amount
+            count += n
+
+        categories = {}
+        for cat_name, currency, amount, n in (
+            base.outerjoin(Category, Expense.category_id == Category.id)
+            .with_entities(
+                Category.name, Expense.currency, func.sum(Expense.amount), func.count()
+            )
+            .group_by(Category.name, Expense.currency)
+        ):
+            entry = categories.setdefault(
+                cat_name or "Sin categoría", {"clp": 0, "usd": 0, "count": 0}
+            )
+            entry[currency.lower()] += amount
+            entry["count"] += n
+
+        return totals, count, categories
+
     def _get_daily_summary(self, date: datetime.datetime) -> str:
         """Get summary for a specific day."""
         start_date = date.replace(hour=0, minute=0, second=0, microsecond=0)
         end_date = start_date + timedelta(days=1)
-        
-        expenses = self._get_expenses_by_date_range(start_date, end_date)
-        
-        if not expenses:
+
+        totals, expense_count, categories = self._aggregate_range(start_date, end_date)
+
+        if not expense_count:
             return "📅 *Resumen del día:*\nNo tienes gastos registrados hoy."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        expense_count = len(expenses)
-        
-        # Get top category
-        categories = {}
-        for expense in expenses:
-            cat_name = expense.category.name if expense.category else "Sin categoría"
-            categories[cat_name] = categories.get(cat_name, 0) + expense.amount
-        
-        top_category = max(categories.items(), key=lambda x: x[1]) if categories else ("N/A", 0)
-        
-        summary = f"📅 *Resumen del día - {date.strftime('%d/%m/%Y')}:*\n\n"
-        summary += f"💰 Total: {total_clp} CLP / {total_usd} USD\n"
-        summary += f"📊 Cantidad de gastos: {expense_count}\n"
-        summary += f"🏆 Categoría principal: {top_category[0]}\n\n"
-        
-        # Show last 3 expenses
-        summary += "*Últimos gastos:*\n"
-        for expense in expenses[:3]:
-            summary += f"• {expense.custom_str(include_category=True, include_tags=False)}\n"
-        
-        if len(expenses) > 3:
-            summary += f"\n_...y {len(expenses) - 3} gastos más_"
-        
-        return summary
+
+        total_clp = self.parse_money_text(totals["CLP"], "CLP")
+        total_usd = self.parse_money_text(totals["USD"], "USD")
+
+        # Top category by combined amount, matching the old Python loop
+        if categories:
+            top_category = max(
+                ((name, amounts["clp"] + amounts["usd"]) for name, amounts in categories.items()),
+                key=lambda x: x[1],
+            )
+        else:
+            top_category = ("N/A", 0)
+
+        parts = [
+            f"📅 *Resumen del día - {date.strftime('%d/%m/%Y')}:*\n\n",
+            f"💰 Total: {total_clp} CLP / {total_usd} USD\n",
+            f"📊 Cantidad de gastos: {expense_count}\n",
+            f"🏆 Categoría principal: {top_category[0]}\n\n",
+        ]
+
+        # Show last 3 expenses via a LIMIT'd query instead of a full fetch
+        last_expenses = (
+            self._display_query()
+            .filter(
+                Expense.expense_date >= start_date,
+                Expense.expense_date < end_date,
+            )
+            .order_by(Expense.expense_date.desc())
+            .limit(3)
+            .all()
+        )
+        parts.append("*Últimos gastos:*\n")
+        for expense in last_expenses:
+            parts.append(f"• {expense.custom_str(include_category=True, include_tags=False)}\n")
+
+        if expense_count > 3:
+            parts.append(f"\n_...y {expense_count - 3} gastos más_")
+
+        return "".join(parts)
 
     def _get_weekly_summary(self, date: datetime.datetime) -> str:
         """Get summary for the current week."""
@@ -347,39 +556,31 @@ class ExpenseManager:
         start_date = monday.replace(hour=0, minute=0, second=0, microsecond=0)
         end_date = start_date + timedelta(days=7)
         
-        expenses = self._get_expenses_by_date_range(start_date, end_date)
-        
-        if not expenses:
+        totals, expense_count, categories = self._aggregate_range(start_date, end_date)
+
+        if not expense_count:
             return "📅 *Resumen semanal:*\nNo tienes gastos registrados esta semana."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        expense_count = len(expenses)
-        
+
+        total_clp = self.parse_money_text(totals["CLP"], "CLP")
+        total_usd = self.parse_money_text(totals["USD"], "USD")
+
         # Calculate daily average
-        daily_avg_clp = sum(exp.amount for exp in expenses if exp.currency == "CLP") / 7
-        daily_avg_usd = sum(exp.amount for exp in expenses if exp.currency == "USD") / 7
-        
-        # Get category breakdown
-        categories = {}
-        for expense in expenses:
-            cat_name = expense.category.name if expense.category else "Sin categoría"
-            if cat_name not in categories:
-                categories[cat_name] = {"clp": 0, "usd": 0, "count": 0}
-            categories[cat_name][expense.currency.lower()] += expense.amount
-            categories[cat_name]["count"] += 1
-        
-        summary = f"📅 *Resumen semanal - {start_date.strftime('%d/%m')} al {end_date.strftime('%d/%m')}:*\n\n"
-        summary += f"💰 Total: {total_clp} CLP / {total_usd} USD\n"
-        summary += f"📊 Cantidad de gastos: {expense_count}\n"
-        summary += f"📈 Promedio diario: {self.parse_money_text(daily_avg_clp, 'CLP')} CLP / {self.parse_money_text(daily_avg_usd, 'USD')} USD\n\n"
-        
-        summary += "*Gastos por categoría:*\n"
+        daily_avg_clp = totals["CLP"] / 7
+        daily_avg_usd = totals["USD"] / 7
+
+        parts = [
+            f"📅 *Resumen semanal - {start_date.strftime('%d/%m')} al {end_date.strftime('%d/%m')}:*\n\n",
+            f"💰 Total: {total_clp} CLP / {total_usd} USD\n",
+            f"📊 Cantidad de gastos: {expense_count}\n",
+            f"📈 Promedio diario: {self.parse_money_text(daily_avg_clp, 'CLP')} CLP / {self.parse_money_text(daily_avg_usd, 'USD')} USD\n\n",
+            "*Gastos por categoría:*\n",
+        ]
         for cat_name, amounts in sorted(categories.items(), key=lambda x: x[1]["clp"] + x[1]["usd"], reverse=True):
             cat_clp = self.parse_money_text(amounts["clp"], "CLP")
             cat_usd = self.parse_money_text(amounts["usd"], "USD")
-            summary += f"• {cat_name}: {cat_clp} CLP / {cat_usd} USD ({amounts['count']} gastos)\n"
-        
-        return summary
+            parts.append(f"• {cat_name}: {cat_clp} CLP / {cat_usd} USD ({amounts['count']} gastos)\n")
+
+        return "".join(parts)
 
     def _get_monthly_summary(self, date: datetime.datetime, target_month: int = None, target_year: int = None) -> str:
         """Get summary for a specific month."""
@@ -394,47 +595,39 @@ class ExpenseManager:
         else:
             end_date = datetime.datetime(target_year, target_month + 1, 1, 0, 0, 0, 0)
         
-        expenses = self._get_expenses_by_date_range(start_date, end_date)
-        
+        totals, expense_count, categories = self._aggregate_range(start_date, end_date)
+
         month_name = self._get_month_name(target_month)
-        
-        if not expenses:
+
+        if not expense_count:
             return f"📅 *Resumen mensual:*\nNo tienes gastos registrados en {month_name} {target_year}."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        expense_count = len(expenses)
-        
+
+        total_clp = self.parse_money_text(totals["CLP"], "CLP")
+        total_usd = self.parse_money_text(totals["USD"], "USD")
+
         # Calculate daily average
         days_in_month = (end_date - start_date).days
-        daily_avg_clp = sum(exp.amount for exp in expenses if exp.currency == "CLP") / days_in_month
-        daily_avg_usd = sum(exp.amount for exp in expenses if exp.currency == "USD") / days_in_month
-        
-        # Get category breakdown
-        categories = {}
-        for expense in expenses:
-            cat_name = expense.category.name if expense.category else "Sin categoría"
-            if cat_name not in categories:
-                categories[cat_name] = {"clp": 0, "usd": 0, "count": 0}
-            categories[cat_name][expense.currency.lower()] += expense.amount
-            categories[cat_name]["count"] += 1
-        
-        summary = f"📅 *Resumen mensual - {month_name} {target_year}:*\n\n"
-        summary += f"💰 Total: {total_clp} CLP / {total_usd} USD\n"
-        summary += f"📊 Cantidad de gastos: {expense_count}\n"
-        summary += f"📈 Promedio diario: {self.parse_money_text(daily_avg_clp, 'CLP')} CLP / {self.parse_money_text(daily_avg_usd, 'USD')} USD\n\n"
-        
-        summary += "*Categorías:*\n"
+        daily_avg_clp = totals["CLP"] / days_in_month
+        daily_avg_usd = totals["USD"] / days_in_month
+
+        parts = [
+            f"📅 *Resumen mensual - {month_name} {target_year}:*\n\n",
+            f"💰 Total: {total_clp} CLP / {total_usd} USD\n",
+            f"📊 Cantidad de gastos: {expense_count}\n",
+            f"📈 Promedio diario: {self.parse_money_text(daily_avg_clp, 'CLP')} CLP / {self.parse_money_text(daily_avg_usd, 'USD')} USD\n\n",
+            "*Categorías:*\n",
+        ]
         for cat_name, amounts in categories.items():
             cat_clp = self.parse_money_text(amounts["clp"], "CLP")
             cat_usd = self.parse_money_text(amounts["usd"], "USD")
-            summary += f"• {cat_name}: "
+            parts.append(f"• {cat_name}: ")
             if amounts["clp"] > 0:
-                summary += f"{cat_clp} CLP"
+                parts.append(f"{cat_clp} CLP")
             if amounts["usd"] > 0:
-                summary += f"| {cat_usd} USD"
-            summary += f" ({amounts['count']} gastos)\n"
+                parts.append(f"| {cat_usd} USD")
+            parts.append(f" ({amounts['count']} gastos)\n")
 
-        return summary
+        return "".join(parts)
 
     def delete_last_expense(self) -> str:
         """Delete the most recent expense for the user."""
@@ -460,84 +653,72 @@ class ExpenseManager:
             return "❌ El término de búsqueda debe tener al menos 2 caracteres."
         
         search_term = search_term.strip().lower()
-        
-        # Search in multiple fields
-        expenses_query = self.expenses
-        
-        # Search by description
-        description_results = expenses_query.filter(
-            Expense.description.ilike(f"%{search_term}%")
-        )
-        
-        # Search by category name
-        category_results = expenses_query.join(Category, Expense.category_id == Category.id).filter(
-            Category.name.ilike(f"%{search_term}%")
-        )
-        
-        # Search by amount (if search term is numeric)
-        amount_results = []
+        pattern = f"%{search_term}%"
+
+        # One OR across description, category name and (when numeric) amount,
+        # deduplicated by the database instead of a Python set union.
+        predicates = [
+            Expense.description.ilike(pattern),
+            Category.name.ilike(pattern),
+        ]
         try:
-            search_amount = float(search_term.replace(",", "."))
-            amount_results = expenses_query.filter(Expense.amount == search_amount)
+            predicates.append(Expense.amount == float(search_term.replace(",", ".")))
         except ValueError:
             pass
-        
-        # Combine all results and remove duplicates
-        all_results = set()
-        for result_set in [description_results, category_results, amount_results]:
-            if result_set:
-                all_results.update(result_set.all())
-        
-        expenses = list(all_results)
-        expenses.sort(key=lambda x: x.expense_date, reverse=True)
-        
-        if not expenses:
+
+        base = self.expenses.outerjoin(
+            Category, Expense.category_id == Category.id
+        ).filter(or_(*predicates))
+
+        # Aggregate totals/count without materializing every matching row
+        totals = {"CLP": 0, "USD": 0}
+        result_count = 0
+        for currency, amount, n in (
+            base.with_entities(Expense.currency, func.sum(Expense.amount), func.count())
+            .group_by(Expense.currency)
+        ):
+            totals[currency] = totals.get(currency, 0) + amount
+            result_count += n
+
+        if not result_count:
             return f"❌ No se encontraron gastos que contengan '{search_term}'."
-        
-        total_clp, total_usd = self._calculate_totals(expenses)
-        result_count = len(expenses)
-        
-        header = f"🔍 *Resultados para '{search_term}':*\n"
-        header += f"📊 {result_count} gasto{'s' if result_count != 1 else ''} encontrado{'s' if result_count != 1 else ''}\n"
-        header += f"💰 Total: {total_clp} CLP / {total_usd} USD\n\n"
-        
-        expenses_list = ""
-        # Show maximum 10 results
-        for expense in expenses[:10]:
-            expenses_list += expense.custom_str(include_category=True, include_tags=True) + "\n\n"
-        
-        if len(expenses) > 10:
-            expenses_list += f"_...y {len(expenses) - 10} resultados más_\n"
-            expenses_list += "💡 *Tip:* Usa un término más específico para refinar la búsqueda."
-        
-        return header + expenses_list
 
-    def _get_expenses_by_date_range(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Expense]:
-        """Get expenses within a date range."""
-        return (
-            self.expenses
-            .filter(
-                Expense.expense_date >= start_date,
-                Expense.expense_date < end_date,
-            )
+        total_clp = self.parse_money_text(totals["CLP"], "CLP")
+        total_usd = self.parse_money_text(totals["USD"], "USD")
+
+        plural = 's' if result_count != 1 else ''
+        parts = [
+            f"🔍 *Resultados para '{search_term}':*\n",
+            f"📊 {result_count} gasto{plural} encontrado{plural}\n",
+            f"💰 Total: {total_clp} CLP / {total_usd} USD\n\n",
+        ]
+
+        # Show maximum 10 results
+        expenses = (
+            base.options(joinedload(Expense.category), selectinload(Expense.tags))
             .order_by(Expense.expense_date.desc())
+            .limit(10)
             .all()
         )
+        for expense in expenses:
+            parts.append(expense.custom_str(include_category=True, include_tags=True))
+            parts.append("\n\n")
+
+        if result_count > 10:
+            parts.append(f"_...y {result_count - 10} resultados más_\n")
+            parts.append("💡 *Tip:* Usa un término más específico para refinar la búsqueda.")
+
+        return "".join(parts)
 
     def _get_month_name(self, month_number: int) -> str:
         """Get Spanish month name from month number."""
-        meses = {
-            1: "enero", 2: "febrero", 3: "marzo", 4: "abril",
-            5: "mayo", 6: "junio", 7: "julio", 8: "agosto",
-            9: "septiembre", 10: "octubre", 11: "noviembre", 12: "diciembre"
-        }
-        return meses.get(month_number, "mes desconocido")
+        return _MESES_NUM_TO_NAME.get(month_number, "mes desconocido")
 
     def parse_money_text(self, number: float, currency: str) -> str:
         """Parse and return a human-readable monetary $1,200.50 for usd or $1.200 for clp"""
         if currency == "USD":
-            return f"${number:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+            return f"${number:,.2f}".translate(_USD_TRANS)
         elif currency == "CLP":
-            return f"${int(number):,}".replace(",", ".")
+            return f"${int(number):,}".translate(_CLP_TRANS)
         else:
             return f"{number} {currency}"
\ No newline at end of file
@@ -1,5 +1,5 @@
 from typing import List
-from app.models import Tag, User
+from app.models import Expense, Tag, User
 
 
 class TagManager:
@@ -18,21 +18,37 @@ class TagManager:
     
     def list_tags(self) -> str:
         """List all tags used by a user."""
-        tags = self.db.query(Tag).join(Tag.expenses).filter_by(user_id=self.user.id).distinct().all()
-        if not tags:
+        # Name-only projection: hydrating Tag objects here would also
+        # select-in load every expense behind each tag.
+        rows = (
+            self.db.query(Tag.name)
+            .join(Tag.expenses)
+            .filter(Expense.user_id == self.user.id)
+            .distinct()
+            .all()
+        )
+        if not rows:
             return "No hay etiquetas disponibles."
-        
-        tag_names = [tag.name for tag in tags]
-        return "Etiquetas existentes:\n" + ", ".join(tag_names)
+
+        return "Etiquetas existentes:\n" + ", ".join(name for (name,) in rows)
     
     def get_or_create_tags(self, tag_names: List[str]) -> List[Tag]:
-        """Get existing tags or create new ones."""
+        """Get existing tags or create new ones.
+
+        One IN query resolves every existing tag, the missing ones are
+        added as a batch, and no commit is issued here: the caller's
+        commit persists tags and expense in the same transaction.
+        """
+        existing = {
+            tag.name: tag
+            for tag in self.db.query(Tag).filter(Tag.name.in_(tag_names))
+        }
         tag_objs = []
         for tag_name in tag_names:
-            tag_obj = self.db.query(Tag).filter_by(name=tag_name).first()
+            tag_obj = existing.get(tag_name)
             if not tag_obj:
                 tag_obj = Tag(name=tag_name)
+                existing[tag_name] = tag_obj
                 self.db.add(tag_obj)
             tag_objs.append(tag_obj)
-        self.db.commit()
         return tag_objs
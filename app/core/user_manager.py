@@ -1,19 +1,41 @@
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from app.models import User
 
 
 class UserManager:
     """Handles user-related operations."""
-    
+
     def __init__(self, db):
         self.db = db
-    
+        # Per-request cache: webhook batches can carry several messages
+        # from the same phone, which would otherwise re-SELECT each time.
+        self._cache: dict[str, User] = {}
+
     def get_or_create_user(self, phone_number: str) -> User:
         """Get existing user or create a new one."""
+        user = self._cache.get(phone_number)
+        if user is not None:
+            return user
         user = self.db.query(User).filter_by(phone=phone_number).first()
         if not user:
-            user = User(phone=phone_number)
-            self.db.add(user)
+            # Race-safe first contact: ON CONFLICT keeps one row, and
+            # RETURNING hands back the inserted user without a re-select.
+            user = (
+                self.db.execute(
+                    pg_insert(User)
+                    .values(phone=phone_number)
+                    .on_conflict_do_nothing(index_elements=["phone"])
+                    .returning(User)
+                )
+                .scalars()
+                .first()
+            )
             self.db.commit()
+            if user is None:
+                # Lost the race: a concurrent delivery owns the row.
+                user = self.db.query(User).filter_by(phone=phone_number).first()
+        self._cache[phone_number] = user
         return user
     
     def is_user_blocked(self, user: User) -> bool:
@@ -27,6 +27,7 @@ if is_lambda:
         pool_timeout=10,
         pool_recycle=300,      # 5 minutes for Lambda
         pool_pre_ping=True,
+        query_cache_size=1200,  # keep all hot statements compiled across invocations
         connect_args={
             "connect_timeout": 10,
             "application_name": "wssp-lambda",
@@ -42,6 +43,7 @@ else:
         pool_timeout=30,
         pool_recycle=1800,  # 30 minutes
         pool_pre_ping=True,
+        query_cache_size=1200,
         echo=False  # Set to True for SQL debugging
     )
 
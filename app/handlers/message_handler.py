@@ -1,3 +1,6 @@
+import logging
+import sys
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Optional
 from app.core.user_manager import UserManager
@@ -8,101 +11,235 @@ from app.services.rate_limiter import RateLimiter
 from app.services.whatsapp_service import WhatsAppService
 from app.models import MessageLog
 from app.webhooks.models import MessageEvent
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+
+logger = logging.getLogger(__name__)
+
+# Tutorial reply built once at import; the command handler just returns
+# the reference.
+_TUTORIAL_TEXT = """📚 *¡Bienvenido al Bot de Gastos!*
+
+🎯 *Cómo registrar un gasto:*
+Envía: `[monto] [categoría] [descripción] [fecha] [@etiquetas]`
+
+📝 *Ejemplos:*
+• `15000 comida almuerzo` - Gasto básico
+• `25000 transporte uber 15/03` - Con fecha
+• `8500 comida café @trabajo` - Con etiqueta
+• `12.50 comida sandwich` - En USD (con decimales)
+
+📅 *Formatos de fecha:*
+• `15/03` o `15-03` (día/mes del año actual)
+• `15/03/2024` o `15-03-2024` (fecha completa)
+
+🏷️ *Etiquetas:*
+• Agregar al gasto: `@trabajo @personal @urgente`
+
+📂 *Categorías:*
+• Ver todas: `cat`, `categoria`, `categories` o `categorias`
+• Gestionar: `cat help`, `cat c <nombre>`, `cat u <id>`, `cat d <id>`
+
+📊 *Ver gastos:*
+• Todos: `gastos` o `g`
+• Por mes: `gastos enero` o `gastos 3`
+• Con etiquetas: `gastos @trabajo`
+• Con opciones: `gastos cat tags` (mostrar categorías y etiquetas)
+
+📈 *Resúmenes:*
+• Hoy: `resumen` o `resumen hoy`
+• Semanal: `resumen semana`
+• Mensual: `resumen mes` (mes actual)
+• Mes específico: `resumen mes enero` o `resumen mes 3`
+
+🔍 *Buscar gastos:*
+• Por descripción: `buscar almuerzo`
+• Por categoría: `buscar comida`
+• Por monto: `buscar 5000`
+
+🗑️ *Eliminar último gasto:*
+• `borrar`, `delete`, `eliminar` o `undo`
+
+🏷️ *Gestión de etiquetas:*
+• Ver etiquetas: `tags` o `etiquetas`
+• Crear etiqueta: `tags create nombre`
+• Eliminar etiqueta: `tags delete nombre`
+
+💬 *Comandos principales:*
+• `tutorial` / `ayuda` / `help` - Esta ayuda
+• `cat` - Ver categorías
+• `gastos` / `g` - Listar gastos
+• `resumen` - Resumen diario
+• `resumen mes [mes]` - Resumen mensual
+• `buscar [término]` - Buscar gastos
+• `borrar` - Eliminar último gasto
+• `tags` - Ver/gestionar etiquetas
+
+✅ *Confirmación de gastos:*
+Después de enviar un gasto, recibirás botones para *Confirmar* o *Rechazar*.
+
+💡 *Tips útiles:*
+• Si no especificas categoría, usa `x`
+• Las fechas sin año asumen el año actual
+• Los montos con decimales se consideran USD
+• Puedes usar múltiples etiquetas: `@trabajo @urgente`
+• Los resúmenes muestran totales y estadísticas detalladas
+• La búsqueda funciona en descripciones, categorías y montos
+
+🚀 ¡Empieza a registrar tus gastos ahora! 💸"""
+
+# Shared across requests: the limiter's sliding windows must outlive a
+# single webhook to ever limit anything, and module scope lets warm
+# Lambda containers reuse them.
+_rate_limiter = RateLimiter()
+
+# Recently processed provider message ids: Meta redelivers webhooks, and a
+# warm container can reject the repeat without the database round-trip the
+# ON CONFLICT insert would otherwise spend. Bounded LRU, newest last.
+_recent_ids: "OrderedDict[str, None]" = OrderedDict()
+_RECENT_IDS_MAX = 4096
+
+
+def _remember_message(message_id: str) -> None:
+    """Record a durably logged message id in the dedup LRU."""
+    _recent_ids[message_id] = None
+    if len(_recent_ids) > _RECENT_IDS_MAX:
+        _recent_ids.popitem(last=False)
 
 
 class MessageHandler:
     """Main handler for processing incoming WhatsApp messages."""
     
-    def __init__(self, db):
+    def __init__(self, db, background=None):
         self.db = db
-        self.rate_limiter = RateLimiter()
+        self.background = background
+        self.rate_limiter = _rate_limiter
         self.user_manager = UserManager(db)
 
+    def _queue_send(self, phone_number: str, message: str):
+        """Send a reply after the response when BackgroundTasks is available.
+
+        Queued tasks run once the webhook has been answered, so the Meta
+        HTTP round-trip no longer sits inside the request's critical path.
+        """
+        if self.background is not None:
+            self.background.add_task(WhatsAppService.send_message, phone_number, message)
+        else:
+            WhatsAppService.send_message(phone_number, message)
+
     def handle(self, event: MessageEvent, raw_payload: dict = None):
         """Process an incoming message event with atomic transaction handling."""
         phone_number = event.from_
         message_id = event.message_id
         text: str = event.text
-        
-        # Check for duplicate messages
-        existing_log = self.db.query(MessageLog).filter_by(
-            provider="meta",
-            provider_message_id=message_id
-        ).first()
-        
-        if existing_log:
-            print(f"Message {message_id} already processed, skipping...")
+
+        # In-process duplicate check first: zero SQL on warm redeliveries.
+        if message_id in _recent_ids:
+            logger.debug("Message %s already processed, skipping...", message_id)
             return
-        
-        # Log the incoming message
-        message_log = MessageLog(
+
+        # Log the incoming message; the unique (provider, provider_message_id)
+        # constraint doubles as the duplicate check, so one INSERT ... ON
+        # CONFLICT DO NOTHING replaces the old SELECT + INSERT pair.
+        log_values = dict(
             provider="meta",
             provider_message_id=message_id,
             chat_id=phone_number,
             direction="in",
             text=text,
             payload_json=raw_payload,
-            status="received"
         )
-        self.db.add(message_log)
-        self.db.commit()
-        
+        insert_stmt = (
+            pg_insert(MessageLog)
+            .values(status="received", **log_values)
+            .on_conflict_do_nothing(constraint="uq_msg_provider_msgid")
+            .returning(MessageLog)
+        )
+        message_log = self.db.execute(insert_stmt).scalars().first()
+        if message_log is None:
+            self.db.rollback()
+            logger.debug("Message %s already processed, skipping...", message_id)
+            return
+        # No commit yet: the log row rides the processing transaction so the
+        # happy path pays one fsync. A concurrent redelivery blocks on the
+        # unique index until this transaction resolves, then skips.
+
         try:
-            # Start transaction for message processing
-            self.db.begin()
-            
+            # Processing transaction opens implicitly on first use
+            # (autobegin); an explicit begin() here is redundant.
+
             # Get or create user
             user = self.user_manager.get_or_create_user(phone_number)
             
             # Rate limiting check
             if not self.rate_limiter.check(user.id):
-                WhatsAppService.send_message(phone_number, "Demasiados mensajes. Espera un momento.")
+                self._queue_send(phone_number, "Demasiados mensajes. Espera un momento.")
                 message_log.status = "rate_limited"
                 self.db.commit()
+                _remember_message(message_id)
                 return
                 
             # Blocked user check
             if self.user_manager.is_user_blocked(user):
-                WhatsAppService.send_message(phone_number, "Tu acceso está bloqueado. Contacta soporte.")
+                self._queue_send(phone_number, "Tu acceso está bloqueado. Contacta soporte.")
                 message_log.status = "blocked"
                 self.db.commit()
+                _remember_message(message_id)
                 return
                 
-            # Update last_seen_at
-            user.last_seen_at = datetime.now(timezone.utc)
+            # Update last_seen_at, but skip the UPDATE during bursts where
+            # it was already touched within the last minute. The written
+            # value is the server clock, so no timestamp travels on the wire.
+            now = datetime.now(timezone.utc)
+            if user.last_seen_at is None or (now - user.last_seen_at).total_seconds() > 60:
+                user.last_seen_at = func.now()
 
             # Process the message
             if event.type == "interactive" and event.interactive:
-                expense_manager = ExpenseManager(self.db, user)
+                expense_manager = ExpenseManager(self.db, user, background=self.background)
                 expense_manager.handle_interactive_response(event.interactive)
             else:
                 response = self._handle_text_message(text, user)
                 if response:  # Only send if there's a response
-                    WhatsAppService.send_message(phone_number, response)
+                    self._queue_send(phone_number, response)
 
             # Mark message as successfully processed
             message_log.status = "processed"
             
             # Commit all changes atomically
             self.db.commit()
-            
+            _remember_message(message_id)
+
         except Exception as e:
             # Rollback all changes if anything fails
             self.db.rollback()
-            
-            # Mark message as failed in a separate transaction
+
+            # Record the failure in a separate transaction. The rollback
+            # left message_log expired and unreadable, so upsert on the
+            # unique key instead: the row is inserted fresh if the rollback
+            # discarded it, or flipped to failed if an intermediate commit
+            # already persisted it.
             try:
-                message_log.status = "failed"
-                message_log.error = str(e)
+                self.db.execute(
+                    pg_insert(MessageLog)
+                    .values(status="failed", error=str(e), **log_values)
+                    .on_conflict_do_update(
+                        constraint="uq_msg_provider_msgid",
+                        set_={"status": "failed", "error": str(e)},
+                    )
+                )
                 self.db.commit()
-            except Exception as log_error:
-                print(f"Failed to log error: {log_error}")
+            except Exception:
+                logger.exception("Failed to log error for message %s", message_id)
                 
+            # Send inline: queued tasks only run after a successful response,
+            # and we are about to re-raise.
             WhatsAppService.send_message(phone_number, "Ocurrió un error procesando tu mensaje. Intenta nuevamente.")
             raise
 
     def _handle_text_message(self, text: str, user) -> Optional[str]:
-        """Route text messages to appropriate handlers."""
+        """Route text messages to appropriate handlers via the command table."""
         stripped_text = text.strip()
         if not stripped_text:
             return "❌ El mensaje está vacío."
@@ -113,108 +250,74 @@ class MessageHandler:
             return "❌ El mensaje está vacío."
         code = items[0]
 
-        if code in ("cat", "category", "categoria", "categories", "categorias"):
-            category_manager = CategoryManager(self.db, user)
-            original_first_word = stripped_text.split()[0]
-            remainder = stripped_text[len(original_first_word):].strip()
-            return category_manager.handle(remainder)
-        elif code in ("tag", "tags", "etiqueta", "etiquetas"):
-            tag_manager = TagManager(self.db, user)
-            if len(items) > 1:
-                action = items[1].lower()
-                tag_name = items[2] if len(items) > 2 else None
-                return tag_manager.action(action, tag_name)
-            else:
-                return tag_manager.list_tags()
-        elif code in ("tutorial", "ayuda", "help"):
-            return self._get_tutorial_text()
-        elif code in ("gastos", "g"):
-            expense_manager = ExpenseManager(self.db, user)
-            return expense_manager.list_expenses(parsed_text)
-        elif code in ("resumen", "summary", "total"):
-            expense_manager = ExpenseManager(self.db, user)
-            return expense_manager.get_summary(parsed_text)
-        elif code in ("borrar", "delete", "eliminar", "undo", "d"):
-            expense_manager = ExpenseManager(self.db, user)
-            return expense_manager.delete_last_expense()
-        elif code in ("buscar", "search", "encontrar", "find", "f"):
-            expense_manager = ExpenseManager(self.db, user)
-            search_term = " ".join(items[1:]) if len(items) > 1 else ""
-            return expense_manager.search_expenses(search_term)
-        else:
-            # Handle expense creation
-            expense_manager = ExpenseManager(self.db, user)
-            expense_manager.create_expense_from_text(parsed_text)
-            return None  # Expense handling sends its own messages
-    
-    def _get_tutorial_text(self) -> str:
-        """Return tutorial text explaining how to use the app."""
-        return """📚 *¡Bienvenido al Bot de Gastos!*
+        handler = self._COMMANDS.get(code)
+        if handler:
+            return handler(self, user, stripped_text, parsed_text, items)
 
-🎯 *Cómo registrar un gasto:*
-Envía: `[monto] [categoría] [descripción] [fecha] [@etiquetas]`
+        # Anything that is not a known command is an expense
+        expense_manager = ExpenseManager(self.db, user, background=self.background)
+        expense_manager.create_expense_from_text(parsed_text)
+        return None  # Expense handling sends its own messages
 
-📝 *Ejemplos:*
-• `15000 comida almuerzo` - Gasto básico
-• `25000 transporte uber 15/03` - Con fecha
-• `8500 comida café @trabajo` - Con etiqueta
-• `12.50 comida sandwich` - En USD (con decimales)
-
-📅 *Formatos de fecha:*
-• `15/03` o `15-03` (día/mes del año actual)
-• `15/03/2024` o `15-03-2024` (fecha completa)
-
-🏷️ *Etiquetas:*
-• Agregar al gasto: `@trabajo @personal @urgente`
-
-📂 *Categorías:*
-• Ver todas: `cat`, `categoria`, `categories` o `categorias`
-• Gestionar: `cat help`, `cat c <nombre>`, `cat u <id>`, `cat d <id>`
-
-📊 *Ver gastos:*
-• Todos: `gastos` o `g`
-• Por mes: `gastos enero` o `gastos 3`
-• Con etiquetas: `gastos @trabajo`
-• Con opciones: `gastos cat tags` (mostrar categorías y etiquetas)
+    def _handle_categories(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `cat`/`categoria` commands, preserving original casing."""
+        category_manager = CategoryManager(self.db, user)
+        # items[0] has the same length as the original-case first word, so
+        # the remainder comes from one slice without re-splitting.
+        remainder = stripped_text[len(items[0]):].strip()
+        return category_manager.handle(remainder)
 
-📈 *Resúmenes:*
-• Hoy: `resumen` o `resumen hoy`
-• Semanal: `resumen semana`
-• Mensual: `resumen mes` (mes actual)
-• Mes específico: `resumen mes enero` o `resumen mes 3`
+    def _handle_tags(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `tags`/`etiquetas` commands."""
+        tag_manager = TagManager(self.db, user)
+        if len(items) > 1:
+            action = items[1].lower()
+            tag_name = items[2] if len(items) > 2 else None
+            return tag_manager.action(action, tag_name)
+        return tag_manager.list_tags()
 
-🔍 *Buscar gastos:*
-• Por descripción: `buscar almuerzo`
-• Por categoría: `buscar comida`
-• Por monto: `buscar 5000`
+    def _handle_tutorial(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `tutorial`/`ayuda`/`help` commands."""
+        return self._get_tutorial_text()
 
-🗑️ *Eliminar último gasto:*
-• `borrar`, `delete`, `eliminar` o `undo`
+    def _handle_list_expenses(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `gastos`/`g` commands."""
+        expense_manager = ExpenseManager(self.db, user)
+        return expense_manager.list_expenses(parsed_text)
 
-🏷️ *Gestión de etiquetas:*
-• Ver etiquetas: `tags` o `etiquetas`
-• Crear etiqueta: `tags create nombre`
-• Eliminar etiqueta: `tags delete nombre`
+    def _handle_summary(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `resumen`/`summary` commands."""
+        expense_manager = ExpenseManager(self.db, user)
+        return expense_manager.get_summary(parsed_text)
 
-💬 *Comandos principales:*
-• `tutorial` / `ayuda` / `help` - Esta ayuda
-• `cat` - Ver categorías
-• `gastos` / `g` - Listar gastos
-• `resumen` - Resumen diario
-• `resumen mes [mes]` - Resumen mensual
-• `buscar [término]` - Buscar gastos
-• `borrar` - Eliminar último gasto
-• `tags` - Ver/gestionar etiquetas
+    def _handle_delete(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `borrar`/`delete`/`undo` commands."""
+        expense_manager = ExpenseManager(self.db, user)
+        return expense_manager.delete_last_expense()
 
-✅ *Confirmación de gastos:*
-Después de enviar un gasto, recibirás botones para *Confirmar* o *Rechazar*.
+    def _handle_search(self, user, stripped_text, parsed_text, items) -> Optional[str]:
+        """Handle `buscar`/`search` commands."""
+        expense_manager = ExpenseManager(self.db, user)
+        search_term = " ".join(items[1:]) if len(items) > 1 else ""
+        return expense_manager.search_expenses(search_term)
 
-💡 *Tips útiles:*
-• Si no especificas categoría, usa `x`
-• Las fechas sin año asumen el año actual
-• Los montos con decimales se consideran USD
-• Puedes usar múltiples etiquetas: `@trabajo @urgente`
-• Los resúmenes muestran totales y estadísticas detalladas
-• La búsqueda funciona en descripciones, categorías y montos
+    # Built once at import: O(1) dict lookup per message instead of walking
+    # an if/elif ladder of alias tuples. Keys are interned so a hit on a
+    # short alias resolves with a pointer compare.
+    _COMMANDS = {}
+    for _aliases, _handler in (
+        (("cat", "category", "categoria", "categories", "categorias"), _handle_categories),
+        (("tag", "tags", "etiqueta", "etiquetas"), _handle_tags),
+        (("tutorial", "ayuda", "help"), _handle_tutorial),
+        (("gastos", "g"), _handle_list_expenses),
+        (("resumen", "summary", "total"), _handle_summary),
+        (("borrar", "delete", "eliminar", "undo", "d"), _handle_delete),
+        (("buscar", "search", "encontrar", "find", "f"), _handle_search),
+    ):
+        for _alias in _aliases:
+            _COMMANDS[sys.intern(_alias)] = _handler
+    del _aliases, _handler, _alias
 
-🚀 ¡Empieza a registrar tus gastos ahora! 💸"""
+    def _get_tutorial_text(self) -> str:
+        """Return tutorial text explaining how to use the app."""
+        return _TUTORIAL_TEXT
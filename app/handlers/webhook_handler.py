@@ -1,33 +1,43 @@
 import json
+import logging
 from fastapi import Request, HTTPException
 from pydantic import ValidationError
 from app.handlers.message_handler import MessageHandler
 from app.webhooks.models import WhatsAppWebhookEvent, MessageEvent
 
 
+logger = logging.getLogger(__name__)
+
+
 class WebhookHandler:
     """Handles WhatsApp webhook processing."""
     
-    def __init__(self, db):
+    def __init__(self, db, background=None):
         self.db = db
-        self.message_handler = MessageHandler(db)
+        self.message_handler = MessageHandler(db, background=background)
     
-    def process_webhook(self, event_data: dict) -> dict:
-        """Process a WhatsApp webhook event."""
+    def process_webhook(self, body: bytes) -> dict:
+        """Process a WhatsApp webhook event from the raw request body."""
         try:
-            webhook_event = WhatsAppWebhookEvent(**event_data)
-            
-            for message_data in webhook_event.get_message_events():
-                message_event = MessageEvent(**message_data)
-                self.message_handler.handle(message_event, raw_payload=event_data)
-                
+            # Parse and validate the bytes in one pass; malformed JSON
+            # surfaces as a ValidationError like any other bad payload.
+            webhook_event = WhatsAppWebhookEvent.model_validate_json(body)
+
+            message_events = webhook_event.get_message_events()
+            if message_events:
+                # Only message-bearing webhooks store payload_json, so the
+                # dict is built here instead of for every status ping.
+                event_data = json.loads(body)
+                for message_data in message_events:
+                    message_event = MessageEvent(**message_data)
+                    self.message_handler.handle(message_event, raw_payload=event_data)
+
             return {"status": "ok"}
-            
+
         except ValidationError as e:
-            print(f"Validation error parsing webhook data: {e}")
+            logger.warning("Validation error parsing webhook data: %s", e)
             raise HTTPException(status_code=400, detail=f"Invalid webhook data: {e}")
-        except Exception as e:
-            import traceback
-            print(f"Unexpected error processing webhook: {e}")
-            print(f"Full traceback: {traceback.format_exc()}")
+        except Exception:
+            # logger.exception formats the traceback itself.
+            logger.exception("Unexpected error processing webhook")
             raise HTTPException(status_code=500, detail="Internal server error")
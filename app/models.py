@@ -16,7 +16,9 @@ from sqlalchemy import (
     String,
     Text,
     UniqueConstraint,
+    event,
     func,
+    update,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncAttrs
@@ -190,6 +192,9 @@ class Category(Base, TimestampMixin):
     is_system: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     emoji: Mapped[Optional[str]] = mapped_column(String(8))
     short_name: Mapped[Optional[str]] = mapped_column(String(48))
+    # Denormalized counter kept in sync by the Expense insert/delete events
+    # below, so reads never need a COUNT(*) over expenses.
+    expense_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
 
     parent: Mapped[Optional[Category]] = relationship(
         remote_side="Category.id", back_populates="children"
@@ -244,6 +249,10 @@ class Expense(Base, TimestampMixin):
         Index("ix_expenses_user_id", "user_id"),
         Index("ix_expenses_group_id", "group_id"),
         Index("ix_expenses_expense_date", "expense_date"),
+        # Composite indexes backing the per-user listing queries, which
+        # always filter by user_id and order by expense_date/created_at.
+        Index("ix_expenses_user_id_expense_date", "user_id", "expense_date"),
+        Index("ix_expenses_user_id_created_at", "user_id", "created_at"),
         CheckConstraint(
             "(user_id IS NOT NULL) OR (group_id IS NOT NULL)",
             name="ck_expense_owner_scope",
@@ -364,6 +373,8 @@ class ExpenseTag(Base):
         UniqueConstraint("expense_id", "tag_id", name="uq_expense_tag"),
         Index("ix_expense_tag_expense_id", "expense_id"),
         Index("ix_expense_tag_tag_id", "tag_id"),
+        # Covers the tag -> expense join so it can be an index-only scan.
+        Index("ix_expense_tag_tag_id_expense_id", "tag_id", "expense_id"),
     )
 
     expense_id: Mapped[int] = mapped_column(
@@ -449,3 +460,25 @@ class UserRule(Base, TimestampMixin):
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
 
     user: Mapped[User] = relationship(back_populates="rules")
+
+
+# ---------- Events ----------
+
+@event.listens_for(Expense, "after_insert")
+def _category_count_on_insert(mapper, connection, target: Expense) -> None:
+    if target.category_id is not None:
+        connection.execute(
+            update(Category)
+            .where(Category.id == target.category_id)
+            .values(expense_count=Category.expense_count + 1)
+        )
+
+
+@event.listens_for(Expense, "after_delete")
+def _category_count_on_delete(mapper, connection, target: Expense) -> None:
+    if target.category_id is not None:
+        connection.execute(
+            update(Category)
+            .where(Category.id == target.category_id)
+            .values(expense_count=Category.expense_count - 1)
+        )
@@ -1,19 +1,21 @@
-from datetime import datetime, timezone
 import collections
+import time
 
 class RateLimiter:
     def __init__(self):
-        self.user_windows = collections.defaultdict(list)
+        self.user_windows = collections.defaultdict(collections.deque)
         self.msg_limit = 30
         self.window_seconds = 300
 
     def check(self, user_id):
-        now = datetime.now(timezone.utc)
+        now = time.monotonic()
         window = self.user_windows[user_id]
-        # Remove old timestamps
-        self.user_windows[user_id] = [t for t in window if (now - t).total_seconds() < self.window_seconds]
-        if len(self.user_windows[user_id]) >= self.msg_limit:
+        cutoff = now - self.window_seconds
+        # Timestamps arrive in order, so expiring from the left is
+        # amortized O(1) per check instead of rebuilding the list.
+        while window and window[0] < cutoff:
+            window.popleft()
+        if len(window) >= self.msg_limit:
             return False
-        self.user_windows[user_id].append(now)
+        window.append(now)
         return True
-
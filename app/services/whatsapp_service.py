@@ -13,6 +13,15 @@ load_dotenv()
 META_API_URL = f"https://graph.facebook.com/v23.0/{os.getenv('META_PHONE_NUMBER_ID')}/messages"
 META_TOKEN = os.getenv("META_ACCESS_TOKEN")
 
+# Shared connection-pooled session: reuses the TCP+TLS connection to the
+# Graph API across sends instead of a fresh handshake per message. Auth
+# headers are constant, so they live on the session too.
+_session = requests.Session()
+_session.headers.update({
+    "Authorization": f"Bearer {META_TOKEN}",
+    "Content-Type": "application/json"
+})
+
 
 class WhatsAppService:
     """Service for sending WhatsApp messages via Meta Business API."""
@@ -21,10 +30,6 @@ class WhatsAppService:
     def send_message(phone_e164: str, text: str):
         """Send a simple text message."""
         try:
-            headers = {
-                "Authorization": f"Bearer {META_TOKEN}",
-                "Content-Type": "application/json"
-            }
             payload = {
                 "messaging_product": "whatsapp",
                 "to": phone_e164,
@@ -32,7 +37,7 @@ class WhatsAppService:
                 "text": {"body": text}
             }
             # Add timeout to prevent hanging
-            resp = requests.post(META_API_URL, headers=headers, json=payload, timeout=5)
+            resp = _session.post(META_API_URL, json=payload, timeout=5)
             return resp.json()
         except requests.exceptions.ConnectTimeout:
             logger.warning(f"⚠️ Timeout sending message to {phone_e164} - Lambda VPC has no internet access")
@@ -45,10 +50,6 @@ class WhatsAppService:
     def send_confirm_interaction(phone_e164: str, body: str, expense_id: int):
         """Send an interactive message with confirm/reject buttons."""
         try:
-            headers = {
-                "Authorization": f"Bearer {META_TOKEN}",
-                "Content-Type": "application/json"
-            }
             payload = {
                 "messaging_product": "whatsapp",
                 "to": phone_e164,
@@ -65,7 +66,7 @@ class WhatsAppService:
                 }
             }
             # Add timeout to prevent hanging
-            resp = requests.post(META_API_URL, headers=headers, json=payload, timeout=5)
+            resp = _session.post(META_API_URL, json=payload, timeout=5)
             return resp.json()
         except requests.exceptions.ConnectTimeout:
             logger.warning(f"⚠️ Timeout sending interactive message to {phone_e164} - Lambda VPC has no internet access")